@@ -0,0 +1,274 @@
+import threading
+import time
+
+import numpy as np
+
+import cam
+
+
+class FakeCameraSystem:
+    """
+    Minimal output source for the broadcaster: a new version per publish()
+    and viewports rendered through a hook the test can block.
+    """
+    def __init__(self):
+        self.running = True
+        self.output_width = 320
+        self.output_version = 0
+        self.output_changed_version = 0
+        self.output_source_version = 0
+        self.output_ready = threading.Condition()
+        self.metrics = cam.PipelineMetrics(enabled=False)
+        self.render_started = threading.Event()
+        self.render_release = threading.Event()
+        self.render_release.set()
+
+    def publish(self):
+        with self.output_ready:
+            self.output_version += 1
+            self.output_changed_version = self.output_version
+            self.output_source_version = self.output_version
+            self.output_ready.notify_all()
+
+    def wait_for_output(self, last_version, timeout=None):
+        with self.output_ready:
+            self.output_ready.wait_for(
+                lambda: self.output_version != last_version or not self.running, timeout)
+            return np.zeros((64, self.output_width, 3), dtype=np.uint8), self.output_version
+
+    def output_intact(self, frame):
+        return True
+
+    def render_viewport(self, profile):
+        self.render_started.set()
+        self.render_release.wait(5)
+        return np.zeros((profile.height, profile.width, 3), dtype=np.uint8)
+
+
+def test_subscribe_while_encoding_keeps_encoder_alive():
+    system = FakeCameraSystem()
+    broadcaster = cam.MJPEGBroadcaster(system)
+    broadcaster.start()
+    try:
+        # A viewer's viewport is being rendered when the viewer leaves
+        first = broadcaster.subscribe(cam.ViewportProfile(0, 90, 160, 96, 70))
+        system.render_release.clear()
+        system.publish()
+        assert system.render_started.wait(5)
+        broadcaster.unsubscribe(first)
+
+        # A new profile prunes the now unwatched channel mid-encode
+        second = broadcaster.subscribe(cam.ViewportProfile(90, 90, 160, 96, 70))
+        assert first not in broadcaster.channels
+        system.render_release.set()
+
+        # The encoder survives and serves the new viewer
+        system.publish()
+        chunk, _ = broadcaster.wait_for_chunk(0, timeout=5, profile=second)
+        assert chunk is not None and b"image/jpeg" in chunk
+        assert broadcaster.thread.is_alive()
+    finally:
+        system.running = False
+        system.publish()
+        system.render_release.set()
+        broadcaster.thread.join(5)
+
+
+def test_next_set_with_only_stale_frames_times_out():
+    assembler = cam.FrameSetAssembler(2, stale_after=1.0)
+    assembler.put(cam.CapturedFrame(None, 0, 1, time.monotonic() - 5))
+
+    assert assembler.next_set(timeout=0.1) is None
+    assert not assembler.has_new_frames()
+
+
+def calibrated_ring_system():
+    """
+    Four cameras laid out like calibrate_from_images() does, with camera 0
+    and camera 3 reaching across the 360° seam.
+    """
+    system = cam.Camera360System(num_cameras=4, output_width=400, output_height=120,
+                                 camera_resolution=(160, 120), metrics=False)
+    system.camera_intrinsics = [None] * 4
+    system.layout_ring([120] * 4)
+    system.build_warp_maps()
+    return system
+
+
+def test_calibrated_ring_wraps_across_the_seam():
+    system = calibrated_ring_system()
+    warper = system.warper
+    assert warper.rois[0][0] < 0
+    assert warper.rois[3][0] + warper.rois[3][2] > warper.output_width
+
+    # Uniform cameras must give a panorama without empty columns
+    frame = np.full((120, 160, 3), 200, dtype=np.uint8)
+    cameras = range(4)
+    images = [warper.warp(frame, i) for i in cameras]
+    offsets = [warper.rois[i][:2] for i in cameras]
+    panorama = system.blend_engine.blend(images, cameras, offsets)
+    assert panorama.max(axis=(0, 2)).min() > 0
+    assert np.abs(panorama[:, [0, -1]].astype(int) - 200).max() <= 1
+
+    # Same for a viewport rendered straight from the cameras across the seam
+    view = cam.ViewportProfile(0, 90, 160, 96, 70)
+    viewport = system.viewport_renderer.render_from_cameras(
+        {i: frame for i in cameras}, view)
+    assert viewport.max(axis=(0, 2)).min() > 0
+
+    # Warping onto a full canvas fills both sides of the seam
+    canvas = np.zeros_like(panorama)
+    warper.warp(frame, 0, dst=canvas)
+    assert canvas[:, 0].min() == 200 and canvas[:, -1].min() == 200
+
+
+def test_output_buffers_retire_frames_before_reuse():
+    buffers = cam.OutputBuffers((2, 2, 3))
+    first = buffers.swap()
+    second = buffers.swap()
+    assert buffers.intact(first) and buffers.intact(second)
+
+    # The third publish makes the first frame's buffer the back buffer
+    buffers.swap()
+    assert buffers.back().base is None and first.base is buffers.back()
+    assert not buffers.intact(first)
+    assert buffers.intact(second)
+    assert buffers.intact(np.zeros(3)) and buffers.intact(None)
+
+
+def test_flapping_camera_keeps_backing_off(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(cam.time, 'monotonic', lambda: now[0])
+    health = cam.CameraHealth(max_failures=1, backoff=0.5, stable_after=10.0)
+
+    delays = []
+    for _ in range(3):
+        # Down, one reconnect attempt, then a few good frames
+        health.read_failed()
+        delays.append(health.reconnect_delay())
+        health.reconnected()
+        now[0] += 1.0
+        health.read_ok()
+    assert delays == [0.5, 1.0, 2.0]
+
+    # Staying up long enough starts the backoff over
+    now[0] += 10.0
+    health.read_ok()
+    health.read_failed()
+    assert health.reconnect_delay() == 0.5
+
+
+def test_async_server_limits_connections_without_request():
+    import socket
+
+    system = FakeCameraSystem()
+    system.broadcaster = cam.MJPEGBroadcaster(system)
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    server = cam.AsyncStreamingServer(system, port=port, max_pending=2)
+    server.start()
+    idle = []
+    try:
+        # Connections that never send their request headers
+        for _ in range(2):
+            idle.append(socket.create_connection(('127.0.0.1', port)))
+        deadline = time.monotonic() + 5
+        while server.pending < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert server.pending == 2
+
+        with socket.create_connection(('127.0.0.1', port), timeout=5) as refused:
+            assert refused.recv(64).startswith(b"HTTP/1.0 503")
+    finally:
+        for s in idle:
+            s.close()
+        system.running = False
+        server.shutdown()
+        server.server_close()
+
+
+def test_overlapping_stitch_workers_use_consecutive_output_slots():
+    import multiprocessing as mp
+
+    system = calibrated_ring_system()
+    geometry = (system.num_cameras, system.output_width, system.output_height,
+                system.camera_resolution)
+    rings = [cam.SharedFrameRing((120, 160, 3), 4) for _ in range(4)]
+    output = cam.SharedFrameRing((system.output_height, system.output_width, 3), 4)
+    frame_events = [threading.Event() for _ in range(2)]
+    output_event = threading.Event()
+    stop_event = threading.Event()
+    ticket = mp.Value('q', -1)
+    output_sequence = mp.Value('q', -1, lock=False)
+
+    # Two stitch workers sharing the rings, as with --stitch-workers 2
+    workers = [threading.Thread(target=cam.stitch_worker,
+                                args=(k, geometry, system.warper.to_arrays(),
+                                      [ring.spec for ring in rings], output.spec,
+                                      frame_events[k], output_event, threading.Lock(),
+                                      ticket, output_sequence, stop_event, 1000.0))
+               for k in range(2)]
+    for worker in workers:
+        worker.start()
+    published = []
+    try:
+        for n in range(8):
+            output_event.clear()
+            for ring in rings:
+                ring.begin_write(n)[...] = 100 + n
+                ring.end_write(n, time.monotonic_ns())
+            for event in frame_events:
+                event.set()
+            assert output_event.wait(5)
+            published.append(int(output.header[0]))
+    finally:
+        stop_event.set()
+        for worker in workers:
+            worker.join(5)
+        for ring in rings + [output]:
+            ring.close()
+
+    assert published == list(range(8))
+    slots = [sequence % output.slots for sequence in published]
+    assert all(a != b for a, b in zip(slots, slots[1:]))
+
+
+def test_initialize_cameras_returns_when_a_camera_fails_to_open(capsys):
+    system = cam.Camera360System(num_cameras=2, output_width=400, output_height=120,
+                                 camera_resolution=(160, 120), metrics=False)
+    start = time.monotonic()
+    system.initialize_cameras(['synthetic:0', '/nonexistent.mp4'])
+    try:
+        assert time.monotonic() - start < 5
+        assert [i for i, _ in system.cameras] == [0]
+
+        # The failed camera keeps reconnecting without repeating its error
+        time.sleep(1.5)
+        assert capsys.readouterr().out.count("Failed to open camera 1") == 1
+    finally:
+        system.cleanup()
+    assert not any(t.is_alive() for t in system.reconnect_threads)
+
+
+def test_unequal_camera_spacing_blends_flat_input_uniformly(tmp_path):
+    system = cam.Camera360System(num_cameras=4, output_width=400, output_height=120,
+                                 camera_resolution=(160, 120), metrics=False)
+    system.camera_intrinsics = [None] * 4
+    system.layout_ring([100, 140, 110, 130])
+    system.build_warp_maps()
+    path = str(tmp_path / "calibration.npz")
+    system.save_calibration(path)
+
+    # Blend weights follow the calibration, also after loading it
+    loaded = cam.Camera360System(num_cameras=4, output_width=400, output_height=120,
+                                 camera_resolution=(160, 120), metrics=False)
+    assert loaded.load_calibration(path)
+
+    frame = np.full((120, 160, 3), 200, dtype=np.uint8)
+    for s in (system, loaded):
+        cameras = range(4)
+        images = [s.warper.warp(frame, i) for i in cameras]
+        offsets = [s.warper.rois[i][:2] for i in cameras]
+        panorama = s.blend_engine.blend(images, cameras, offsets)
+        assert np.abs(panorama.astype(int) - 200).max() <= 1